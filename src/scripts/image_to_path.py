@@ -9,6 +9,7 @@ Fourier epicycles C programs.
 import argparse
 import struct
 import sys
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
 try:
@@ -19,6 +20,172 @@ except ImportError:
     print("Please install: pip install opencv-python numpy", file=sys.stderr)
     sys.exit(1)
 
+# Optional: scipy gives O(N log N) point ordering via a k-d tree.
+# Without it we fall back to the O(N^2) vectorized scan below.
+try:
+    from scipy.spatial import cKDTree
+except ImportError:
+    cKDTree = None
+
+# Optional: numba compiles the greedy fallback loop to native code,
+# removing the per-iteration numpy dispatch overhead.
+try:
+    from numba import njit, prange
+except ImportError:
+    njit = None
+
+
+def _kdtree_order(xr, yi, start_idx):
+    """
+    Nearest-neighbor ordering using a k-d tree.
+
+    Queries a small neighborhood (k=32) around the current point and takes
+    the first unused hit, doubling k on the rare miss. O(N log N) total
+    instead of the O(N^2) full-distance scan.
+
+    Args:
+        xr, yi: float64 arrays of point coordinates
+        start_idx: Index of the starting point
+
+    Returns:
+        Integer array giving the visiting order of all points
+    """
+    n = xr.size
+    tree = cKDTree(np.column_stack([xr, yi]))
+
+    order = [start_idx]
+    used = np.zeros(n, dtype=bool)
+    used[start_idx] = True
+    cur = start_idx
+
+    for _ in range(n - 1):
+        k = 32
+        nxt = -1
+        while nxt < 0:
+            k = min(k, n)
+            _, idx = tree.query((xr[cur], yi[cur]), k=k)
+            for j in np.atleast_1d(idx):
+                if j < n and not used[j]:
+                    nxt = int(j)
+                    break
+            if nxt < 0:
+                if k == n:
+                    # All neighbors used - pick any remaining point
+                    nxt = int(np.flatnonzero(~used)[0])
+                    break
+                k *= 2
+        order.append(nxt)
+        used[nxt] = True
+        cur = nxt
+
+    return np.array(order, dtype=int)
+
+
+if njit is not None:
+    @njit(cache=True, fastmath=True)
+    def _greedy_order_jit(xr, yi, start_idx):
+        """
+        Compiled nearest-neighbor ordering: two tight loops over flat
+        float64 arrays, fusing the subtract/square/argmin per step.
+        """
+        n = xr.size
+        order = np.empty(n, dtype=np.int64)
+        used = np.zeros(n, dtype=np.bool_)
+        order[0] = start_idx
+        used[start_idx] = True
+        cx = xr[start_idx]
+        cy = yi[start_idx]
+
+        for i in range(1, n):
+            best = -1
+            best_d2 = np.inf
+            for j in range(n):
+                if used[j]:
+                    continue
+                dx = xr[j] - cx
+                dy = yi[j] - cy
+                d2 = dx * dx + dy * dy
+                if d2 < best_d2:
+                    best_d2 = d2
+                    best = j
+            order[i] = best
+            used[best] = True
+            cx = xr[best]
+            cy = yi[best]
+
+        return order
+
+    @njit(cache=True, parallel=True)
+    def _xy_to_complex_jit(xy):
+        """
+        Convert an (n, 2) contour coordinate array to complex points,
+        splitting the rows across threads with prange.
+        """
+        n = xy.shape[0]
+        out = np.empty(n, dtype=np.complex128)
+        for i in prange(n):
+            out[i] = complex(xy[i, 0], xy[i, 1])
+        return out
+else:
+    _greedy_order_jit = None
+    _xy_to_complex_jit = None
+
+
+def _contour_to_complex(c):
+    """
+    Convert one cv2 contour to a 1-D array of complex points.
+
+    Args:
+        c: Contour as returned by cv2.findContours, shape (n, 1, 2)
+
+    Returns:
+        Complex array of n points (x + iy)
+    """
+    xy = np.ascontiguousarray(c.reshape(-1, 2))
+    if _xy_to_complex_jit is not None:
+        return _xy_to_complex_jit(xy)
+    # Read the narrow integer columns directly; numpy upcasts to
+    # complex128 inside the ufuncs, so the 8-byte float64 copy of the
+    # whole coordinate array never materializes
+    return xy[:, 0] + 1j * xy[:, 1]
+
+
+def _argmin_order(xr, yi, start_idx):
+    """
+    Nearest-neighbor ordering via vectorized argmin over remaining points.
+
+    O(N^2) fallback used when scipy is not available.
+
+    Args:
+        xr, yi: float64 arrays of point coordinates
+        start_idx: Index of the starting point
+
+    Returns:
+        Integer array giving the visiting order of all points
+    """
+    order = [start_idx]
+    # Swap-pop the chosen index with the last live entry each step:
+    # O(1) removal with no reallocation, unlike np.delete
+    alive = np.arange(xr.size)
+    alive[start_idx] = alive[-1]
+    n_alive = xr.size - 1
+    cx = xr[start_idx]
+    cy = yi[start_idx]
+
+    while n_alive > 0:
+        cand = alive[:n_alive]
+        dx = xr[cand] - cx
+        dy = yi[cand] - cy
+        j_local = int(np.argmin(dx * dx + dy * dy))
+        j = int(cand[j_local])
+        order.append(j)
+        alive[j_local] = alive[n_alive - 1]
+        n_alive -= 1
+        cx = xr[j]
+        cy = yi[j]
+
+    return np.array(order, dtype=int)
+
 
 def greedy_shortest_path(points):
     """
@@ -33,31 +200,36 @@ def greedy_shortest_path(points):
     Returns:
         Reordered array where each point is close to the next
     """
-    pts = np.unique(points)  # Remove duplicates
+    # Remove duplicates. Viewing the complex buffer as (x, y) float64
+    # records lets np.unique sort with plain float comparisons instead
+    # of the slower complex comparison path, and adds no copy.
+    z = np.ascontiguousarray(points, dtype=complex)
+    pairs = z.view([('x', np.float64), ('y', np.float64)])
+    pts = np.unique(pairs).view(complex)
     if pts.size == 0:
         return pts
 
     # Start from lowest y (then lowest x) for stability
     start_idx = np.lexsort((pts.real, pts.imag))[0]
 
-    order = [start_idx]
-    used = np.zeros(pts.size, dtype=bool)
-    used[start_idx] = True
-    cur = pts[start_idx]
+    # Work on separate float64 coordinate arrays: half the bytes of
+    # complex128 per pass, and squared distances avoid the sqrt that
+    # np.abs() would compute on every iteration.
+    xr = pts.real.copy()
+    yi = pts.imag.copy()
 
     # Pure greedy nearest-neighbor - no loop-closing bias
-    for _ in range(pts.size - 1):
-        dists = np.abs(pts - cur)
-        dists[used] = np.inf  # Exclude already-used points
-        j = int(np.argmin(dists))
-        order.append(j)
-        used[j] = True
-        cur = pts[j]
+    if cKDTree is not None:
+        order = _kdtree_order(xr, yi, start_idx)
+    elif _greedy_order_jit is not None:
+        order = _greedy_order_jit(xr, yi, start_idx)
+    else:
+        order = _argmin_order(xr, yi, start_idx)
 
-    return pts[np.array(order, dtype=int)]
+    return pts[order]
 
 
-def resample_path_evenly(points, num_samples, closed=True):
+def resample_path_evenly(points, num_samples, closed=True, seglen=None):
     """
     Resample path at evenly spaced intervals along arc length.
 
@@ -69,6 +241,8 @@ def resample_path_evenly(points, num_samples, closed=True):
         points: Array of complex numbers (ordered path)
         num_samples: Number of evenly spaced samples (M)
         closed: If True, treat as closed loop (connect last->first)
+        seglen: Optional precomputed segment lengths (one per segment),
+            for callers that already have the consecutive distances
 
     Returns:
         Resampled array with M points at even arc-length intervals
@@ -82,40 +256,153 @@ def resample_path_evenly(points, num_samples, closed=True):
     # Number of segments: n if closed (includes last->first), n-1 if open
     segs = n if closed else (n - 1)
 
-    # Calculate segment lengths
-    seglen = np.empty(segs, dtype=float)
-    for i in range(segs):
-        a = z[i]
-        b = z[(i + 1) % n]  # wraps to 0 if closed
-        seglen[i] = abs(b - a)
+    # Calculate segment lengths in one vectorized pass (unless the
+    # caller handed them in)
+    nxt = np.concatenate([z[1:], z[:1]]) if closed else z[1:]
+    cur = z if closed else z[:-1]
+    if seglen is None:
+        seglen = np.abs(nxt - cur)
+    else:
+        seglen = np.asarray(seglen, dtype=float)
+
+    # Cumulative arc lengths, written directly into the final buffer so
+    # no intermediate cumsum array is allocated; total falls out as the
+    # last entry instead of a separate sum pass
+    cum = np.empty(segs + 1, dtype=float)
+    cum[0] = 0.0
+    np.cumsum(seglen, out=cum[1:])
 
-    total = float(seglen.sum())
+    total = float(cum[-1])
     if total <= 1e-12:
         return np.repeat(z[:1], num_samples)
 
-    # Cumulative arc lengths
-    cum = np.concatenate([[0.0], np.cumsum(seglen)])
-
     # Sample at k/M for k=0,1,...,M-1 (not including endpoint at 100%)
-    out = np.empty(num_samples, dtype=complex)
-    for k in range(num_samples):
-        d = (k / num_samples) * total  # Key: k/M, not k/(M-1)
-
-        # Find segment containing this arc length
-        i = np.searchsorted(cum, d, side='right') - 1
-        if i >= segs:
-            i = segs - 1
-
-        a = z[i]
-        b = z[(i + 1) % n]
-        local = d - cum[i]
-        L = seglen[i] if seglen[i] > 0 else 1.0
-        u = local / L
-        out[k] = a + (b - a) * u
+    d = np.arange(num_samples) * (total / num_samples)  # Key: k/M, not k/(M-1)
+
+    # Locate the segment for every sample with one batched searchsorted,
+    # then interpolate all samples with vector ops
+    i = np.searchsorted(cum, d, side='right') - 1
+    np.clip(i, 0, segs - 1, out=i)
+
+    # Assemble the output with in-place ops on a precomputed per-segment
+    # slope so each sample costs one gather, one multiply and one add
+    seglen_safe = np.where(seglen > 0, seglen, 1.0)
+    dz = nxt - cur
+
+    u = d - cum[i]
+    u /= seglen_safe[i]
+    out = dz[i]
+    out *= u
+    out += cur[i]
 
     return out
 
 
+def _dedup_preserve_order(points):
+    """
+    Remove duplicate points while keeping the first occurrence in place.
+
+    CHAIN_APPROX_NONE walks a one-pixel-wide stroke down and then back,
+    so every interior point appears twice; dropping the repeats halves
+    the spurious arc length without disturbing the path order.
+
+    Args:
+        points: Array of complex numbers (ordered path)
+
+    Returns:
+        Array with later duplicates removed, original order preserved
+    """
+    z = np.ascontiguousarray(points, dtype=complex)
+    pairs = z.view([('x', np.float64), ('y', np.float64)])
+    _, first = np.unique(pairs, return_index=True)
+    return z[np.sort(first)]
+
+
+def order_contours(contour_paths):
+    """
+    Chain per-contour paths into one path, keeping each contour's native
+    point order.
+
+    cv2.findContours with CHAIN_APPROX_NONE already returns every
+    contour's points in traversal order, so only the contours themselves
+    need ordering. Starting from the contour with the lowest head point,
+    greedily append whichever unused contour has an endpoint closest to
+    the current path end, reversing it when its tail is the nearer end.
+    O(C^2) in the contour count, which is tiny next to the point count.
+
+    Args:
+        contour_paths: List of complex arrays, one per contour
+
+    Returns:
+        Single concatenated array of complex points
+    """
+    if len(contour_paths) == 1:
+        return contour_paths[0]
+
+    heads = np.array([p[0] for p in contour_paths])
+    tails = np.array([p[-1] for p in contour_paths])
+
+    # Start from the contour whose head has lowest y (then lowest x)
+    start = int(np.lexsort((heads.real, heads.imag))[0])
+
+    used = np.zeros(len(contour_paths), dtype=bool)
+    used[start] = True
+    ordered = [contour_paths[start]]
+    cur_end = tails[start]
+
+    for _ in range(len(contour_paths) - 1):
+        d_head = np.abs(heads - cur_end)
+        d_tail = np.abs(tails - cur_end)
+        d_head[used] = np.inf
+        d_tail[used] = np.inf
+        j_head = int(np.argmin(d_head))
+        j_tail = int(np.argmin(d_tail))
+
+        if d_head[j_head] <= d_tail[j_tail]:
+            j = j_head
+            nxt = contour_paths[j]
+        else:
+            j = j_tail
+            nxt = contour_paths[j][::-1]
+
+        ordered.append(nxt)
+        used[j] = True
+        cur_end = nxt[-1]
+
+    return np.concatenate(ordered)
+
+
+def _canny_edges(gray, threshold1, threshold2):
+    """
+    Run Canny edge detection, on the GPU when OpenCV has CUDA support.
+
+    Falls back to the CPU implementation when no CUDA device is present
+    or OpenCV was built without the cuda module.
+
+    Args:
+        gray: Grayscale input image
+        threshold1: First threshold for the hysteresis procedure
+        threshold2: Second threshold for the hysteresis procedure
+
+    Returns:
+        Binary edge map (uint8)
+    """
+    try:
+        if cv2.cuda.getCudaEnabledDeviceCount() > 0:
+            # CUDA Canny handles the outermost pixel ring differently
+            # from the CPU version; pad with one replicated pixel and
+            # crop the result so borders match cv2.Canny
+            padded = cv2.copyMakeBorder(gray, 1, 1, 1, 1, cv2.BORDER_REPLICATE)
+            gpu_gray = cv2.cuda.GpuMat()
+            gpu_gray.upload(padded)
+            detector = cv2.cuda.createCannyEdgeDetector(threshold1, threshold2)
+            edges = detector.detect(gpu_gray).download()
+            return np.ascontiguousarray(edges[1:-1, 1:-1])
+    except (AttributeError, cv2.error):
+        pass
+    return cv2.Canny(gray, threshold1, threshold2)
+
+
 def subsample_path(points, max_points=800):
     """
     Intelligently subsample path to reduce point count while preserving shape.
@@ -135,7 +422,8 @@ def subsample_path(points, max_points=800):
     return points[::step]
 
 
-def extract_edges(image, threshold1=100, threshold2=100, min_contour_length=50, max_points=1024):
+def extract_edges(image, threshold1=100, threshold2=100, min_contour_length=50, max_points=1024,
+                  legacy_ordering=False, downsample=True):
     """
     Extract edges from an image and convert to complex points.
     Replicates the exact behavior of the working script's load_image_edges().
@@ -146,6 +434,10 @@ def extract_edges(image, threshold1=100, threshold2=100, min_contour_length=50,
         threshold2: Second threshold for Canny edge detection
         min_contour_length: Minimum number of points in a contour
         max_points: Maximum points to output (for performance)
+        legacy_ordering: If True, order individual points with greedy
+            nearest-neighbor instead of chaining whole contours
+        downsample: If True, stride oversized edge maps down to
+            4 * max_points before ordering; disable to keep every point
 
     Returns:
         numpy array of complex numbers representing the path
@@ -156,32 +448,65 @@ def extract_edges(image, threshold1=100, threshold2=100, min_contour_length=50,
     else:
         gray = image
 
-    # Find edges using Canny
-    edges = cv2.Canny(gray, threshold1, threshold2)
+    # Find edges using Canny (GPU-accelerated when available)
+    edges = _canny_edges(gray, threshold1, threshold2)
 
     # Find contours
     contours, _ = cv2.findContours(edges, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_NONE)
 
     # Concatenate ALL contours
-    pts_list = []
-    for c in contours:
-        if len(c) < min_contour_length:
-            continue
-        xy = c.reshape(-1, 2).astype(float)
-        pts_list.append(xy[:, 0] + 1j * xy[:, 1])
-
-    if not pts_list:
+    kept = [c for c in contours if len(c) >= min_contour_length]
+    if not kept:
         raise ValueError("No significant contours (>={} points) detected".format(min_contour_length))
 
-    points = np.concatenate(pts_list)
-    print(f"  Extracted {len(points)} edge points from {len(pts_list)} contours")
-
-    # Order points using greedy shortest path
-    print(f"  Ordering {len(points)} points...")
-    points = greedy_shortest_path(points)
+    # Convert contours in parallel: the numpy kernels release the GIL,
+    # so a thread pool overlaps per-contour work. Skipped when the
+    # numba kernel is active (it already spans all cores) or for a
+    # handful of contours, where pool startup outweighs the work.
+    if len(kept) >= 4 and _xy_to_complex_jit is None:
+        with ThreadPoolExecutor() as pool:
+            pts_list = list(pool.map(_contour_to_complex, kept))
+    else:
+        pts_list = [_contour_to_complex(c) for c in kept]
+
+    total_pts = sum(len(p) for p in pts_list)
+    print(f"  Extracted {total_pts} edge points from {len(pts_list)} contours")
+
+    # Drop the duplicate points CHAIN_APPROX_NONE produces on thin
+    # strokes (down-and-back traversal) while keeping contour order.
+    # The legacy path dedups again inside greedy_shortest_path, but
+    # doing it here keeps both orderings fed with the same point set.
+    pts_list = [_dedup_preserve_order(p) for p in pts_list]
+    total_pts = sum(len(p) for p in pts_list)
+
+    # Downsample oversized inputs before ordering rather than dragging
+    # every raw edge pixel through ordering, trimming and resampling.
+    # A budget of 4x the final count keeps ample detail for the
+    # arc-length resample; striding each contour preserves its order.
+    budget = 4 * max_points
+    if downsample and total_pts > budget:
+        # Shared ceil stride so the budget is genuinely met
+        step = -(-total_pts // budget)
+        pts_list = [p[::step] for p in pts_list]
+        new_total = sum(len(p) for p in pts_list)
+        if new_total < total_pts:
+            total_pts = new_total
+            print(f"  Downsampled to {total_pts} points before ordering")
+
+    if legacy_ordering:
+        # Order points using greedy shortest path (original behavior)
+        points = np.concatenate(pts_list)
+        print(f"  Ordering {len(points)} points...")
+        points = greedy_shortest_path(points)
+    else:
+        # Chain contours end-to-end, preserving each contour's native
+        # point order instead of re-ordering every point greedily
+        print(f"  Chaining {len(pts_list)} contours...")
+        points = order_contours(pts_list)
 
     # Detect and remove problematic large jumps at the end of the path
-    # These occur when greedy algorithm connects distant contours
+    # These occur when the ordering step connects distant contours
+    seglen = None
     if len(points) > 100:
         # Calculate distances between consecutive points
         distances = np.abs(np.diff(points))
@@ -192,17 +517,19 @@ def extract_edges(image, threshold1=100, threshold2=100, min_contour_length=50,
         threshold = median_dist * 5.0
 
         # Find first bad jump in the tail
-        trim_from = len(points)
-        for i in range(start_check, len(points) - 1):
-            if distances[i] > threshold:
-                trim_from = i
-                break
+        bad = np.flatnonzero(distances[start_check:] > threshold)
+        trim_from = start_check + int(bad[0]) if bad.size else len(points)
 
         if trim_from < len(points):
             trimmed = len(points) - trim_from
             points = points[:trim_from]
+            distances = distances[:trim_from - 1]
             print(f"  Trimmed {trimmed} points with large jumps (>{threshold:.1f}) from end")
 
+        # Reuse the consecutive distances for resampling; only the
+        # closing segment (last -> first) is missing
+        seglen = np.concatenate([distances, [abs(points[0] - points[-1])]])
+
     # Resample at evenly spaced arc-length intervals
     # Use closed=True to treat as closed loop (avoids duplicate endpoint)
     target_points = min(len(points), max_points)
@@ -211,7 +538,7 @@ def extract_edges(image, threshold1=100, threshold2=100, min_contour_length=50,
     else:
         print(f"  Resampling {len(points)} points at even arc-length intervals (closed loop)...")
 
-    points = resample_path_evenly(points, target_points, closed=True)
+    points = resample_path_evenly(points, target_points, closed=True, seglen=seglen)
     print(f"  Final point count: {len(points)}")
 
     return points
@@ -230,18 +557,22 @@ def normalize_points(points):
     if len(points) == 0:
         return points
 
+    # Compute each extremum once instead of re-traversing the arrays
+    # for both the centering and the scaling steps
     real_parts = points.real
     imag_parts = points.imag
+    real_min, real_max = real_parts.min(), real_parts.max()
+    imag_min, imag_max = imag_parts.min(), imag_parts.max()
 
     # Center the points
-    center_x = (real_parts.max() + real_parts.min()) / 2
-    center_y = (imag_parts.max() + imag_parts.min()) / 2
+    center_x = (real_max + real_min) / 2
+    center_y = (imag_max + imag_min) / 2
     points = points - complex(center_x, center_y)
 
     # Scale to fit in a reasonable range (e.g., -5 to 5)
     max_extent = max(
-        real_parts.max() - real_parts.min(),
-        imag_parts.max() - imag_parts.min()
+        real_max - real_min,
+        imag_max - imag_min
     )
 
     if max_extent > 0:
@@ -261,13 +592,16 @@ def save_binary_path(points, output_file):
             - 8 bytes: real part (double)
             - 8 bytes: imaginary part (double)
     """
+    # complex128 is stored as interleaved (real, imag) float64 pairs,
+    # which is exactly the on-disk layout the C programs read
+    data = np.ascontiguousarray(points, dtype=np.complex128)
+
     with open(output_file, 'wb') as f:
         # Write number of points
-        f.write(struct.pack('I', len(points)))
+        f.write(struct.pack('I', len(data)))
 
-        # Write each point
-        for point in points:
-            f.write(struct.pack('dd', point.real, point.imag))
+        # Write all points in one bulk call
+        data.tofile(f)
 
 
 def save_text_path(points, output_file):
@@ -276,9 +610,9 @@ def save_text_path(points, output_file):
 
     Format: real,imaginary
     """
-    with open(output_file, 'w') as f:
-        for point in points:
-            f.write(f"{point.real},{point.imag}\n")
+    z = np.asarray(points, dtype=complex)
+    np.savetxt(output_file, np.column_stack([z.real, z.imag]),
+               fmt='%.17g', delimiter=',')
 
 
 def main():
@@ -311,6 +645,16 @@ def main():
         default=1024,
         help='Maximum number of points to output (default: 1024)'
     )
+    parser.add_argument(
+        '--legacy-ordering',
+        action='store_true',
+        help='Order individual points with greedy nearest-neighbor instead of chaining contours'
+    )
+    parser.add_argument(
+        '--no-downsample',
+        action='store_true',
+        help='Do not downsample large edge maps before ordering (slower, keeps every point)'
+    )
     parser.add_argument(
         '--no-normalize',
         action='store_true',
@@ -345,7 +689,9 @@ def main():
             args.threshold1,
             args.threshold2,
             args.min_contour_length,
-            args.max_points
+            args.max_points,
+            legacy_ordering=args.legacy_ordering,
+            downsample=not args.no_downsample
         )
     except ValueError as e:
         print(f"Error: {e}", file=sys.stderr)
@@ -362,11 +708,10 @@ def main():
     if args.preview:
         print("Showing preview (close window to continue)...")
         preview = np.zeros_like(image)
-        for point in points:
-            x = int(point.real * 50 + image.shape[1] / 2)
-            y = int(-point.imag * 50 + image.shape[0] / 2)
-            if 0 <= x < preview.shape[1] and 0 <= y < preview.shape[0]:
-                preview[y, x] = [255, 255, 255]
+        x = (points.real * 50 + image.shape[1] / 2).astype(int)
+        y = (-points.imag * 50 + image.shape[0] / 2).astype(int)
+        inside = (x >= 0) & (x < preview.shape[1]) & (y >= 0) & (y < preview.shape[0])
+        preview[y[inside], x[inside]] = [255, 255, 255]
         cv2.imshow('Preview', preview)
         cv2.waitKey(0)
         cv2.destroyAllWindows()